@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 """
 Automated Egg Price Scraper for Raspberry Pi
-Scrapes NECC egg prices daily and maintains monthly CSV files
+Scrapes NECC egg prices daily and maintains monthly Feather files (with CSV exports)
 """
 
 import requests
+import calendar
 from datetime import datetime
 import pandas as pd
-from bs4 import BeautifulSoup
+import pyarrow as pa
+import pyarrow.dataset as ds
+from io import StringIO
 import os
 import logging
 from pathlib import Path
@@ -29,50 +32,36 @@ class EggPriceScraper:
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
         
+        # Reuse one pooled connection (keep-alive) for every request
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
+        
     def scrape_website(self):
         """Scrape live data from NECC website"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-            
-            response = requests.get(self.url, headers=headers, timeout=30)
+            response = self.session.get(self.url, timeout=30)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, "html.parser")
-            table = soup.find("table", {"border": "1px"})
-            
-            if not table:
-                raise ValueError("Target table not found on website")
-                
-            return soup
+            return response.text
             
         except Exception as e:
             logger.error(f"Failed to scrape website: {e}")
             raise
     
-    def parse_table(self, soup):
+    def parse_table(self, html):
         """Parse HTML table into DataFrame"""
         try:
-            table = soup.find("table", {"border": "1px"})
-            rows = table.find_all("tr")
+            # read_html raises ValueError if the target table is missing
+            tables = pd.read_html(StringIO(html), attrs={"border": "1px"}, flavor="lxml", header=0)
+            df = tables[0]
             
-            # Parse table
-            data = []
-            for row in rows:
-                cols = row.find_all(["td", "th"])
-                cols = [col.get_text(strip=True) for col in cols]
-                if cols:
-                    data.append(cols)
-            
-            if not data:
+            if df.empty:
                 raise ValueError("No data found in table")
-                
-            df = pd.DataFrame(data[1:], columns=data[0])
             
-            # Clean data - remove header rows
-            df = df[df["Name Of Zone / Day"] != "NECC SUGGESTED EGG PRICES"]
-            df = df[df["Name Of Zone / Day"] != "Prevailing Prices"]
-            df = df[df["Name Of Zone / Day"].notna()]
+            # Clean data - remove header rows and blank names in one pass
+            names = df["Name Of Zone / Day"]
+            df = df[~names.isin({"NECC SUGGESTED EGG PRICES", "Prevailing Prices"}) & names.notna()]
             
             logger.info(f"Parsed {len(df)} city records")
             return df
@@ -83,114 +72,170 @@ class EggPriceScraper:
     
     def get_clean_cities(self, df):
         """Extract and clean city list"""
-        city_column = df["Name Of Zone / Day"]
-        city_list = city_column.dropna().tolist()
+        city_column = df["Name Of Zone / Day"].dropna()
         
-        # Remove non-city headers
-        city_list = [city for city in city_list 
-                    if "egg price" not in city.lower() 
-                    and "price" not in city.lower()
-                    and city.strip() != ""]
+        # Remove non-city headers ("egg price" rows also contain "price")
+        mask = ~city_column.str.contains("price", case=False, na=False) & city_column.str.strip().ne("")
         
         # Deduplicate and sort
-        fixed_city_list = sorted(set(city_list))
+        fixed_city_list = sorted(city_column[mask].unique().tolist())
         
         logger.info(f"Found {len(fixed_city_list)} unique cities")
         return fixed_city_list
     
-    def get_monthly_csv_path(self, date=None):
-        """Get path for monthly CSV file"""
+    def get_monthly_path(self, date=None, suffix=".feather"):
+        """Get path for monthly data file (Feather by default, CSV export with suffix=".csv")"""
         if date is None:
             date = datetime.now()
         
-        filename = f"egg_prices_{date.year}_{date.month:02d}.csv"
+        filename = f"egg_prices_{date.year}_{date.month:02d}{suffix}"
         return self.data_dir / filename
     
-    def update_monthly_csv(self, df, cities):
-        """Update or create monthly CSV with today's data"""
+    def update_monthly_data(self, df, cities):
+        """Update or create the monthly data file (and CSV export); returns (path, city rows)"""
         today = datetime.now()
-        today_col = str(today.day)
-        csv_path = self.get_monthly_csv_path(today)
+        today_col = today.day
+        monthly_path = self.get_monthly_path(today)
+        csv_path = self.get_monthly_path(today, suffix=".csv")
         
         try:
             # Filter data for clean cities
             city_df = df[df["Name Of Zone / Day"].isin(cities)].copy()
             
-            if csv_path.exists():
-                # Load existing monthly data
-                monthly_df = pd.read_csv(csv_path)
-                logger.info(f"Loaded existing monthly file: {csv_path}")
+            # Drop repeated rows so each city maps to a single label
+            city_df = city_df.drop_duplicates("Name Of Zone / Day", keep="last")
+            
+            if monthly_path.exists() or csv_path.exists():
+                # Load existing monthly data, falling back to the CSV export
+                # for months written before the Feather store existed
+                if monthly_path.exists():
+                    monthly_df = pd.read_feather(monthly_path).set_index("Name Of Zone / Day").astype(float)
+                    logger.info(f"Loaded existing monthly file: {monthly_path}")
+                else:
+                    # "-" marks a missing price in the CSV export
+                    monthly_df = pd.read_csv(csv_path, na_values=["-"], index_col="Name Of Zone / Day").astype(float)
+                    logger.info(f"Loaded existing monthly file: {csv_path}")
+                
+                # Key day columns by int in memory (file formats store them as text)
+                monthly_df.columns = [int(c) if c.isdigit() else c for c in monthly_df.columns]
+                
+                # read_html collapses repeated whitespace in city names, so
+                # match older rows (e.g. "Ranchi  (CC)") against the same form
+                monthly_df.index = monthly_df.index.str.replace(r"\s+", " ", regex=True)
                 
                 # Update today's column
                 if today_col in monthly_df.columns:
                     logger.info(f"Updating existing data for day {today_col}")
                 else:
                     logger.info(f"Adding new column for day {today_col}")
-                    monthly_df[today_col] = "-"
-                
-                # Update prices for cities that have data
-                for _, row in city_df.iterrows():
-                    city_name = row["Name Of Zone / Day"]
-                    if today_col in row and row[today_col] != "-":
-                        # Find city in monthly_df and update
-                        mask = monthly_df["Name Of Zone / Day"] == city_name
-                        if mask.any():
-                            monthly_df.loc[mask, today_col] = row[today_col]
-                        else:
-                            # Add new city if not exists
-                            new_row = {col: "-" for col in monthly_df.columns}
-                            new_row["Name Of Zone / Day"] = city_name
-                            new_row[today_col] = row[today_col]
-                            monthly_df = pd.concat([monthly_df, pd.DataFrame([new_row])], ignore_index=True)
+                    monthly_df[today_col] = float("nan")
                 
             else:
                 # Create new monthly file
-                logger.info(f"Creating new monthly file: {csv_path}")
+                logger.info(f"Creating new monthly file: {monthly_path}")
                 
                 # Create columns for all days of the month
-                import calendar
                 days_in_month = calendar.monthrange(today.year, today.month)[1]
-                columns = ["Name Of Zone / Day"] + [str(i) for i in range(1, days_in_month + 1)] + ["Average"]
+                columns = list(range(1, days_in_month + 1)) + ["Average"]
+                
+                # Initialize monthly dataframe, one row per city
+                monthly_df = pd.DataFrame(
+                    index=pd.Index(cities, name="Name Of Zone / Day"),
+                    columns=columns,
+                    dtype=float
+                )
+            
+            # Add cities missing from the monthly file in a single reindex
+            new_cities = city_df["Name Of Zone / Day"].values
+            monthly_df = monthly_df.reindex(monthly_df.index.union(new_cities))
+            
+            # Write today's prices in one aligned assignment, skipping "-"
+            # The scraped table keeps its text headers
+            if str(today_col) in city_df.columns:
+                prices = pd.to_numeric(city_df[str(today_col)], errors="coerce").values
+                has_price = ~pd.isna(prices)
+                monthly_df.loc[new_cities[has_price], today_col] = prices[has_price]
+            
+            monthly_df = monthly_df.reset_index()
+            
+            # Calculate average over the day columns (missing prices are NaN)
+            day_cols = [c for c in monthly_df.columns if isinstance(c, int)]
+            monthly_df["Average"] = monthly_df[day_cols].mean(axis=1, skipna=True).round(2)
+            
+            # Feather needs string column names
+            monthly_df.columns = monthly_df.columns.map(str)
+            
+            # Dictionary-encode the repeated city names (kept by Feather)
+            monthly_df["Name Of Zone / Day"] = monthly_df["Name Of Zone / Day"].astype("category")
+            
+            # Save updated monthly file, plus a human-readable CSV export
+            monthly_df.to_feather(monthly_path, compression="zstd")
+            monthly_df.to_csv(csv_path, index=False, encoding="utf-8-sig", na_rep="-", float_format="%g")
+            logger.info(f"Successfully updated monthly data: {monthly_path}")
+            
+            return monthly_path, city_df
+            
+        except Exception as e:
+            logger.error(f"Failed to update monthly data: {e}")
+            raise
+    
+    def rebuild_dataset(self):
+        """Rebuild the long-format Parquet dataset (year=/month= partitions) from all monthly files"""
+        dataset_dir = self.data_dir / "parquet"
+        
+        try:
+            # Prefer the Feather file when a month also has a CSV export
+            monthly_files = {p.stem: p for p in self.data_dir.glob("egg_prices_*.csv")}
+            monthly_files.update({p.stem: p for p in self.data_dir.glob("egg_prices_*.feather")})
+            
+            frames = []
+            for stem, path in sorted(monthly_files.items()):
+                year, month = (int(part) for part in stem.replace("egg_prices_", "").split("_"))
                 
-                # Initialize monthly dataframe
-                monthly_data = []
-                for city in cities:
-                    row = {col: "-" for col in columns}
-                    row["Name Of Zone / Day"] = city
-                    monthly_data.append(row)
+                if path.suffix == ".feather":
+                    df = pd.read_feather(path)
+                else:
+                    df = pd.read_csv(path, na_values=["-"], dtype={str(day): "float32" for day in range(1, 32)})
                 
-                monthly_df = pd.DataFrame(monthly_data)
+                day_cols = [c for c in df.columns if c.isdigit()]
+                long_df = df.melt(
+                    id_vars=["Name Of Zone / Day"],
+                    value_vars=day_cols,
+                    var_name="Day",
+                    value_name="Price"
+                ).dropna(subset=["Price"])
                 
-                # Add today's data
-                for _, row in city_df.iterrows():
-                    city_name = row["Name Of Zone / Day"]
-                    if today_col in row and row[today_col] != "-":
-                        mask = monthly_df["Name Of Zone / Day"] == city_name
-                        if mask.any():
-                            monthly_df.loc[mask, today_col] = row[today_col]
-            
-            # Calculate average (excluding "-" values)
-            def calc_average(row):
-                prices = []
-                for col in [str(i) for i in range(1, 32)]:
-                    if col in row and row[col] != "-" and pd.notna(row[col]):
-                        try:
-                            prices.append(float(row[col]))
-                        except:
-                            pass
-                return round(sum(prices) / len(prices), 2) if prices else "-"
-            
-            monthly_df["Average"] = monthly_df.apply(calc_average, axis=1)
-            
-            # Save updated monthly file
-            monthly_df.to_csv(csv_path, index=False, encoding="utf-8-sig")
-            logger.info(f"Successfully updated monthly CSV: {csv_path}")
-            
-            return csv_path
+                long_df["Date"] = pd.to_datetime({"year": year, "month": month, "day": long_df["Day"].astype(int)})
+                long_df["year"] = year
+                long_df["month"] = month
+                frames.append(long_df)
+            
+            if not frames:
+                return None
+            
+            history = pd.concat(frames, ignore_index=True)
+            
+            # Older CSV months keep repeated whitespace in some city names
+            history["City"] = history["Name Of Zone / Day"].astype(str).str.replace(r"\s+", " ", regex=True)
+            history["Price"] = history["Price"].astype("float32")
+            history = history[["City", "Date", "Price", "year", "month"]]
+            
+            ds.write_dataset(
+                pa.Table.from_pandas(history, preserve_index=False),
+                dataset_dir,
+                format="parquet",
+                partitioning=["year", "month"],
+                partitioning_flavor="hive",
+                existing_data_behavior="delete_matching"
+            )
+            logger.info(f"Rebuilt price history dataset: {dataset_dir} ({len(history)} rows)")
+            
+            return dataset_dir
             
         except Exception as e:
-            logger.error(f"Failed to update monthly CSV: {e}")
-            raise
+            # The dataset is derived from the monthly files; keep the scrape going
+            logger.warning(f"Failed to rebuild price history dataset: {e}")
+            return None
     
     def run_daily_scrape(self):
         """Main function to run daily scraping"""
@@ -198,32 +243,35 @@ class EggPriceScraper:
             logger.info("Starting daily egg price scraping...")
             
             # Scrape website
-            soup = self.scrape_website()
+            html = self.scrape_website()
             
             # Parse table
-            df = self.parse_table(soup)
+            df = self.parse_table(html)
             
             # Get clean cities
             cities = self.get_clean_cities(df)
             
-            # Update monthly CSV
-            csv_path = self.update_monthly_csv(df, cities)
+            # Update monthly data (returns the city rows it already filtered)
+            monthly_path, city_df = self.update_monthly_data(df, cities)
             
             # Save today's simple format too (for backup)
             today = datetime.now()
             today_col = str(today.day)
             
-            city_df = df[df["Name Of Zone / Day"].isin(cities)].copy()
-            if today_col in df.columns:
-                result = city_df[["Name Of Zone / Day", today_col]].copy()
+            if today_col in city_df.columns:
+                result = city_df[["Name Of Zone / Day", today_col]].reset_index(drop=True)
                 result.columns = ["City", "Rate"]
+                result["Rate"] = pd.to_numeric(result["Rate"], errors="coerce")
                 
-                daily_path = self.data_dir / f"daily_prices_{today.strftime('%Y%m%d')}.csv"
-                result.to_csv(daily_path, index=False, encoding="utf-8-sig")
+                daily_path = self.data_dir / f"daily_prices_{today.strftime('%Y%m%d')}.feather"
+                result.to_feather(daily_path, compression="zstd")
                 logger.info(f"Saved daily backup: {daily_path}")
             
+            # Refresh the cross-month dataset used for dashboard trends
+            self.rebuild_dataset()
+            
             logger.info("Daily scraping completed successfully!")
-            return csv_path
+            return monthly_path
             
         except Exception as e:
             logger.error(f"Daily scraping failed: {e}")
@@ -234,8 +282,8 @@ def main():
     scraper = EggPriceScraper()
     
     try:
-        csv_path = scraper.run_daily_scrape()
-        print(f"✅ Successfully updated: {csv_path}")
+        monthly_path = scraper.run_daily_scrape()
+        print(f"✅ Successfully updated: {monthly_path}")
         
     except Exception as e:
         print(f"❌ Scraping failed: {e}")
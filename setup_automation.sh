@@ -13,7 +13,7 @@ echo "📁 Created project directory: $PROJECT_DIR"
 
 # Install required Python packages
 echo "📦 Installing Python dependencies..."
-pip3 install --user requests pandas beautifulsoup4 streamlit plotly
+pip3 install --user requests pandas lxml streamlit plotly orjson pyarrow
 
 # Create data directory
 mkdir -p egg_data
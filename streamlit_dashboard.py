@@ -6,13 +6,19 @@ Real-time dashboard showing current egg prices and trends
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
+import pyarrow.dataset as ds
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 from pathlib import Path
 import glob
 import logging
 
+# Serialize figures for st.plotly_chart with orjson (numpy arrays natively)
+pio.json.config.default_engine = "orjson"
+
 # Page config
 st.set_page_config(
     page_title="Egg Price Dashboard",
@@ -21,33 +27,108 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_data(show_spinner=False)
+def read_monthly_file(file_path, mtime):
+    """Read a monthly data file; mtime is part of the cache key so edits invalidate it"""
+    file_path = Path(file_path)
+    if file_path.suffix == ".feather":
+        df = pd.read_feather(file_path, dtype_backend="pyarrow")
+    else:
+        # Parse with the multithreaded Arrow reader straight into Arrow-backed
+        # columns; day columns come back as float32 and "-" becomes null
+        df = pd.read_csv(
+            file_path,
+            engine="pyarrow",
+            dtype_backend="pyarrow",
+            na_values=["-"],
+            dtype={str(day): "float32[pyarrow]" for day in range(1, 32)}
+        )
+    
+    # City names repeat across files; store them as categorical codes and
+    # index by them so city lookups are hashed instead of full-column scans
+    df["Name Of Zone / Day"] = df["Name Of Zone / Day"].astype("category")
+    df = df.set_index("Name Of Zone / Day")
+    
+    # Key day columns by int so they can be selected directly (df[day])
+    df.columns = [int(c) if c.isdigit() else c for c in df.columns]
+    
+    if file_path.suffix == ".feather":
+        day_cols = [c for c in df.columns if isinstance(c, int)]
+        df[day_cols] = df[day_cols].astype("float32[pyarrow]")
+    
+    return df
+
+@st.cache_data(ttl=60, show_spinner=False)
+def find_latest_monthly_file(data_dir):
+    """Glob for the newest monthly file; cached briefly so reruns skip the glob and stats"""
+    try:
+        data_dir = Path(data_dir)
+        
+        # Prefer the Feather file when a month also has a CSV export
+        monthly_files = {p.stem: p for p in data_dir.glob("egg_prices_*.csv")}
+        monthly_files.update({p.stem: p for p in data_dir.glob("egg_prices_*.feather")})
+        if not monthly_files:
+            return None
+        
+        # Sort by modification time, get latest
+        latest_file = max(monthly_files.values(), key=lambda x: x.stat().st_mtime)
+        return latest_file
+        
+    except Exception as e:
+        st.error(f"Error finding data files: {e}")
+        return None
+
+@st.cache_data(show_spinner=False)
+def monthly_csv_bytes(file_path, mtime):
+    """CSV bytes of a monthly file for download, reusing the scraper's CSV export"""
+    csv_path = Path(file_path).with_suffix(".csv")
+    if csv_path.exists():
+        return csv_path.read_bytes()
+    
+    df = read_monthly_file(file_path, mtime)
+    return df.reset_index().rename(columns=str).to_csv(index=False, na_rep="-").encode("utf-8-sig")
+
+@st.cache_data(show_spinner=False)
+def build_price_history(df, year, month):
+    """Melt the wide month into long (Date, Price) rows indexed by city"""
+    day_cols = [c for c in df.columns if isinstance(c, int)]
+    history = df[day_cols].melt(
+        var_name="Day",
+        value_name="Price",
+        ignore_index=False
+    ).dropna(subset=["Price"])
+    
+    history["Date"] = pd.to_datetime({"year": year, "month": month, "day": history["Day"]})
+    
+    # Stable sort keeps each city's rows in day order
+    history = history.sort_index(kind="stable")
+    return history[["Date", "Price"]]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def read_city_history(dataset_dir, city):
+    """Read one city's prices from the partitioned dataset; the filter is pushed down to Parquet"""
+    # The dataset stores city names with whitespace collapsed
+    city = " ".join(str(city).split())
+    
+    dataset = ds.dataset(dataset_dir, format="parquet", partitioning="hive")
+    table = dataset.to_table(columns=["Date", "Price"], filter=ds.field("City") == city)
+    return table.to_pandas().sort_values("Date", ignore_index=True)
+
 class EggPriceDashboard:
     def __init__(self, data_dir="egg_data"):
         self.data_dir = Path(data_dir)
         
     def get_latest_monthly_file(self):
-        """Get the most recent monthly CSV file"""
-        try:
-            csv_files = list(self.data_dir.glob("egg_prices_*.csv"))
-            if not csv_files:
-                return None
-            
-            # Sort by modification time, get latest
-            latest_file = max(csv_files, key=lambda x: x.stat().st_mtime)
-            return latest_file
-            
-        except Exception as e:
-            st.error(f"Error finding data files: {e}")
-            return None
+        """Get the most recent monthly data file (Feather, or CSV for older months)"""
+        return find_latest_monthly_file(str(self.data_dir))
     
     def load_monthly_data(self, file_path):
         """Load and process monthly data"""
         try:
-            df = pd.read_csv(file_path)
+            df = read_monthly_file(str(file_path), file_path.stat().st_mtime)
             
             # Get file info
-            filename = file_path.name
-            year_month = filename.replace("egg_prices_", "").replace(".csv", "")
+            year_month = file_path.stem.replace("egg_prices_", "")
             year, month = year_month.split("_")
             
             return df, int(year), int(month)
@@ -56,59 +137,41 @@ class EggPriceDashboard:
             st.error(f"Error loading data: {e}")
             return None, None, None
     
-    def get_current_prices(self, df):
-        """Get today's prices"""
-        today = datetime.now().day
-        today_col = str(today)
-        
-        if today_col not in df.columns:
+    @st.cache_data(show_spinner=False)
+    def get_current_prices(_self, df, day):
+        """Get prices for the given day of the month"""
+        if day not in df.columns:
             return None
             
-        current_data = df[["Name Of Zone / Day", today_col]].copy()
-        current_data.columns = ["City", "Price"]
-        
-        # Filter out rows with no price data
-        current_data = current_data[current_data["Price"] != "-"]
-        current_data = current_data[current_data["Price"].notna()]
+        # Day columns are already numeric; one mask drops rows with no price data
+        prices = df[day]
+        mask = prices.notna().to_numpy()
+        if not mask.any():
+            return None
         
-        # Convert price to numeric
-        current_data["Price"] = pd.to_numeric(current_data["Price"], errors="coerce")
-        current_data = current_data.dropna()
+        current_data = pd.DataFrame({
+            "City": df.index.array[mask],
+            "Price": prices.to_numpy()[mask]
+        })
         
-        return current_data.sort_values("Price", ascending=False)
+        return current_data
     
-    def get_price_trends(self, df, city):
-        """Get price trend for a specific city"""
+    def get_price_trends(self, df, city, year, month):
+        """Get price trend for a city across all months, or the given month as a fallback"""
         try:
-            city_row = df[df["Name Of Zone / Day"] == city]
-            if city_row.empty:
-                return None
-                
-            city_data = city_row.iloc[0]
-            
-            # Extract daily prices
-            prices = []
-            dates = []
-            
-            for day in range(1, 32):
-                day_col = str(day)
-                if day_col in city_data and city_data[day_col] != "-":
-                    try:
-                        price = float(city_data[day_col])
-                        prices.append(price)
-                        # Create date (assuming current month/year for now)
-                        date = datetime.now().replace(day=day)
-                        dates.append(date)
-                    except:
-                        pass
+            # Cross-month history from the scraper's Parquet dataset
+            dataset_dir = self.data_dir / "parquet"
+            if dataset_dir.exists():
+                trend_df = read_city_history(str(dataset_dir), city)
+                if not trend_df.empty:
+                    return trend_df
             
-            if not prices:
+            # Long (city, Date, Price) rows are built once per month and cached
+            history = build_price_history(df, year, month)
+            if city not in history.index:
                 return None
-                
-            trend_df = pd.DataFrame({
-                "Date": dates,
-                "Price": prices
-            })
+            
+            trend_df = history.loc[[city]].reset_index(drop=True)
             
             return trend_df
             
@@ -116,50 +179,60 @@ class EggPriceDashboard:
             st.error(f"Error getting trends for {city}: {e}")
             return None
     
-    def create_price_map(self, current_data):
-        """Create a price comparison chart (placeholder for map)"""
+    def create_price_bars(self, current_data):
+        """Create the top-20 city price bars (placeholder for map)"""
         if current_data is None or current_data.empty:
             return None
             
-        fig = px.bar(
-            current_data.head(20),  # Top 20 cities
-            x="Price",
-            y="City",
+        # Top 20 cities: O(N) partition, then sort only those k
+        prices = current_data["Price"].to_numpy()
+        k = min(20, prices.size)
+        idx = np.argpartition(-prices, k - 1)[:k]
+        idx = idx[np.argsort(-prices[idx], kind="stable")]
+        top_prices = prices[idx]
+        
+        return go.Bar(
+            x=top_prices,
+            y=current_data["City"].to_numpy()[idx],
             orientation="h",
-            title="Current Egg Prices by City (₹ per 100 eggs)",
-            color="Price",
-            color_continuous_scale="RdYlGn_r"
+            name="Current Price",
+            marker=dict(color=top_prices, colorscale="RdYlGn_r")
         )
-        
-        fig.update_layout(
-            height=600,
-            yaxis={"categoryorder": "total ascending"}
+    
+    def create_dashboard_chart(self, price_bars, trend_data, city):
+        """Combine the city price bars and one city's trend into a single figure"""
+        fig = make_subplots(
+            rows=1,
+            cols=2,
+            column_widths=[0.66, 0.34],
+            subplot_titles=(
+                "Current Egg Prices by City (₹ per 100 eggs)",
+                f"Egg Price Trend - {city}"
+            )
         )
         
-        return fig
-    
-    def create_trend_chart(self, trend_data, city):
-        """Create price trend chart for a city"""
-        if trend_data is None or trend_data.empty:
-            return None
-            
-        fig = go.Figure()
+        fig.add_trace(price_bars, row=1, col=1)
         
-        fig.add_trace(go.Scatter(
-            x=trend_data["Date"],
-            y=trend_data["Price"],
-            mode="lines+markers",
-            name=f"{city} Price Trend",
-            line=dict(width=3),
-            marker=dict(size=8)
-        ))
+        if trend_data is not None and not trend_data.empty:
+            fig.add_trace(
+                go.Scattergl(
+                    x=trend_data["Date"],
+                    y=trend_data["Price"].to_numpy(),
+                    mode="lines+markers",
+                    name=f"{city} Price Trend",
+                    line=dict(width=3),
+                    marker=dict(size=8)
+                ),
+                row=1,
+                col=2
+            )
         
-        fig.update_layout(
-            title=f"Egg Price Trend - {city}",
-            xaxis_title="Date",
-            yaxis_title="Price (₹ per 100 eggs)",
-            hovermode="x unified"
-        )
+        fig.update_yaxes(categoryorder="total ascending", row=1, col=1)
+        fig.update_xaxes(title_text="Date", row=1, col=2)
+        fig.update_yaxes(title_text="Price (₹ per 100 eggs)", row=1, col=2)
+        
+        # uirevision keeps zoom/pan state when only the selected city changes
+        fig.update_layout(height=600, showlegend=False, uirevision="fixed")
         
         return fig
     
@@ -171,33 +244,79 @@ class EggPriceDashboard:
             
         col1, col2, col3, col4 = st.columns(4)
         
+        # Work on the raw array; prices have no NaN after get_current_prices
+        prices = current_data["Price"].to_numpy()
+        imax = prices.argmax()
+        imin = prices.argmin()
+        
         with col1:
-            avg_price = current_data["Price"].mean()
+            avg_price = prices.mean()
             st.metric("Average Price", f"₹{avg_price:.0f}")
         
         with col2:
-            max_price = current_data["Price"].max()
-            max_city = current_data[current_data["Price"] == max_price]["City"].iloc[0]
+            max_price = prices[imax]
+            max_city = current_data["City"].iat[imax]
             st.metric("Highest Price", f"₹{max_price:.0f}", f"{max_city}")
         
         with col3:
-            min_price = current_data["Price"].min()
-            min_city = current_data[current_data["Price"] == min_price]["City"].iloc[0]
+            min_price = prices[imin]
+            min_city = current_data["City"].iat[imin]
             st.metric("Lowest Price", f"₹{min_price:.0f}", f"{min_city}")
         
         with col4:
             price_range = max_price - min_price
             st.metric("Price Range", f"₹{price_range:.0f}")
 
+@st.cache_resource
+def get_dashboard(data_dir="egg_data"):
+    """Dashboard instance shared across reruns"""
+    return EggPriceDashboard(data_dir)
+
+@st.fragment
+def render_trends(dashboard, df, current_data, price_bars, year, month):
+    """City selector and combined chart; reruns alone when the city changes"""
+    # City selector for trends, above the trend panel
+    _, select_col = st.columns([2, 1])
+    with select_col:
+        cities = sorted(current_data["City"].tolist())
+        selected_city = st.selectbox("Select City", cities)
+    
+    trend_data = None
+    if selected_city:
+        trend_data = dashboard.get_price_trends(df, selected_city, year, month)
+    
+    chart = dashboard.create_dashboard_chart(price_bars, trend_data, selected_city)
+    st.plotly_chart(chart, use_container_width=True, key="main")
+    
+    if trend_data is not None:
+        # Show trend stats
+        if len(trend_data) > 1:
+            latest_price = trend_data["Price"].iloc[-1]
+            prev_price = trend_data["Price"].iloc[-2]
+            change = latest_price - prev_price
+            change_pct = (change / prev_price) * 100
+            
+            if change > 0:
+                st.success(f"📈 +₹{change:.0f} (+{change_pct:.1f}%)")
+            elif change < 0:
+                st.error(f"📉 ₹{change:.0f} ({change_pct:.1f}%)")
+            else:
+                st.info("➡️ No change")
+    else:
+        st.info(f"No trend data available for {selected_city}")
+
 def main():
     """Main Streamlit app"""
     
+    # One timestamp per rerun, shared by everything below
+    now = datetime.now()
+    
     # Title and header
     st.title("Egg Price Dashboard 🥚")
     st.markdown("Real-time egg price monitoring across India")
     
     # Initialize dashboard
-    dashboard = EggPriceDashboard()
+    dashboard = get_dashboard()
     
     # Load data
     latest_file = dashboard.get_latest_monthly_file()
@@ -219,10 +338,13 @@ def main():
     
     # Auto-refresh
     if st.button("🔄 Refresh Data"):
+        # Pick up files written since the last glob
+        find_latest_monthly_file.clear()
+        read_city_history.clear()
         st.rerun()
     
     # Get current prices
-    current_data = dashboard.get_current_prices(df)
+    current_data = dashboard.get_current_prices(df, now.day)
     
     # Display statistics
     st.subheader("📊 Today's Market Summary")
@@ -230,65 +352,43 @@ def main():
     
     st.divider()
     
-    # Create two columns for layout
-    col1, col2 = st.columns([2, 1])
+    # Price comparison and city trend share one figure
+    st.subheader("🗺️ Current Prices by City & 📈 Price Trends")
     
-    with col1:
-        # Price comparison chart
-        st.subheader("🗺️ Current Prices by City")
-        
-        if current_data is not None and not current_data.empty:
-            price_chart = dashboard.create_price_map(current_data)
-            if price_chart:
-                st.plotly_chart(price_chart, use_container_width=True)
-        else:
-            st.warning("No current price data available for today")
-    
-    with col2:
-        # City selector for trends
-        st.subheader("📈 Price Trends")
+    if current_data is not None and not current_data.empty:
+        price_bars = dashboard.create_price_bars(current_data)
         
-        if current_data is not None and not current_data.empty:
-            cities = sorted(current_data["City"].tolist())
-            selected_city = st.selectbox("Select City", cities)
-            
-            if selected_city:
-                trend_data = dashboard.get_price_trends(df, selected_city)
-                
-                if trend_data is not None:
-                    trend_chart = dashboard.create_trend_chart(trend_data, selected_city)
-                    if trend_chart:
-                        st.plotly_chart(trend_chart, use_container_width=True)
-                    
-                    # Show trend stats
-                    if len(trend_data) > 1:
-                        latest_price = trend_data["Price"].iloc[-1]
-                        prev_price = trend_data["Price"].iloc[-2]
-                        change = latest_price - prev_price
-                        change_pct = (change / prev_price) * 100
-                        
-                        if change > 0:
-                            st.success(f"📈 +₹{change:.0f} (+{change_pct:.1f}%)")
-                        elif change < 0:
-                            st.error(f"📉 ₹{change:.0f} ({change_pct:.1f}%)")
-                        else:
-                            st.info("➡️ No change")
-                else:
-                    st.info(f"No trend data available for {selected_city}")
-        else:
-            st.info("No cities available for trend analysis")
+        # Bars are built here; a city change only reruns the fragment
+        render_trends(dashboard, df, current_data, price_bars, year, month)
+    else:
+        st.warning("No current price data available for today")
     
     st.divider()
     
     # Raw data table
     with st.expander("📋 View Raw Data"):
-        st.dataframe(df, use_container_width=True)
+        # Send one page of rows to the browser; the full month is a download
+        page_size = 100
+        page_count = (len(df) + page_size - 1) // page_size
+        page = 1
+        if page_count > 1:
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+        
+        start = (page - 1) * page_size
+        st.dataframe(df.iloc[start:start + page_size].rename(columns=str), use_container_width=True)
+        
+        st.download_button(
+            "⬇️ Download full month (CSV)",
+            data=monthly_csv_bytes(str(latest_file), latest_file.stat().st_mtime),
+            file_name=f"egg_prices_{year}_{month:02d}.csv",
+            mime="text/csv"
+        )
     
     # Footer
     st.markdown("---")
     st.markdown(
         "📍 Data source: [NECC](https://www.e2necc.com/home/eggprice) | "
-        f"🕒 Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        f"🕒 Last updated: {now.strftime('%Y-%m-%d %H:%M:%S')}"
     )
 
 if __name__ == "__main__":